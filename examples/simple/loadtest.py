@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load test of the example application under a concurrent WSGI server
+
+The application is served by Werkzeug's WSGI server in a separate process,
+either multi-threaded or multi-process, against a file-backed SQLite database
+by default, or any database given by SQLAlchemy URL, e.g., a local PostgreSQL.
+
+Many concurrent clients generate mixed read and write traffic, for a number
+of concurrency levels in turn, each starting from a freshly seeded database,
+and for each Diced view, report throughput, tail latency, and time the
+server spent waiting for a connection from the pool, executing SQL
+statements and committing, the latter two including waiting for locks,
+e.g., SQLite waits for its exclusive lock on commit.
+
+e.g.,
+
+.. code-block:: sh
+
+  python loadtest.py --concurrency 1,8,32 --duration 10
+  python loadtest.py --processes 4 --database postgresql:///diced
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlencode
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection
+    from urllib import urlencode
+
+from flask import g
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+from app import User, app, db
+
+
+#: relative weights of views in generated traffic
+MIX = {
+    'index': 10,
+    'detail': 60,
+    'create': 10,
+    'edit': 15,
+    'delete': 5,
+}
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def instrument():
+    """reports time spent on database per request in response headers
+
+    :code:`X-Pool-Wait` is the time spent waiting for connections from the
+    pool, :code:`X-DB-Time` is the time spent executing SQL statements,
+    :code:`X-Commit-Time` is the time spent in DBAPI commits, all in seconds.
+    """
+    engine = db.engine
+
+    def add(name, elapsed):
+        setattr(g, name, getattr(g, name, 0.0) + elapsed)
+
+    def timed(name, func):
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(name, clock() - start)
+        return timed_func
+
+    engine.pool.connect = timed('pool_wait', engine.pool.connect)
+    engine.dialect.do_commit = timed('commit_time', engine.dialect.do_commit)
+
+    def start_timer(*args, **kwargs):
+        g.cursor_start = clock()
+
+    def stop_timer(*args, **kwargs):
+        add('db_time', clock() - g.pop('cursor_start', clock()))
+
+    event.listen(engine, 'before_cursor_execute', start_timer)
+    event.listen(engine, 'after_cursor_execute', stop_timer)
+
+    @app.after_request
+    def add_timing_headers(response):
+        response.headers['X-Pool-Wait'] = repr(g.get('pool_wait', 0.0))
+        response.headers['X-DB-Time'] = repr(g.get('db_time', 0.0))
+        response.headers['X-Commit-Time'] = repr(g.get('commit_time', 0.0))
+        return response
+
+
+def setup_database(database, rows):
+    """creates tables and the initial users"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for n in range(rows):
+            db.session.add(User(
+                username='user%d' % n, email='user%d@example.com' % n))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+
+def serve(database, processes, ports):
+    """serves the application, sends the port it listens on to ports"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.config['WTF_CSRF_ENABLED'] = False
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with app.app_context():
+        instrument()
+    server = make_server(
+        '127.0.0.1', 0, app,
+        threaded=processes == 1, processes=processes)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def request_for(view, rng, rows):
+    """returns method, path and body of a request to view"""
+    pk = rng.randint(1, rows)
+    name = 'load%d' % rng.getrandbits(48)
+    form = urlencode({'username': name, 'email': name + '@example.com'})
+    return {
+        'index': ('GET', '/', None),
+        'detail': ('GET', '/%d/' % pk, None),
+        'create': ('POST', '/create/', form),
+        'edit': ('POST', '/%d/edit/' % pk, form),
+        'delete': ('POST', '/%d/delete/' % pk, urlencode({'submit': 1})),
+    }[view]
+
+
+def client(port, rows, deadline, results):
+    """sends requests until deadline, appends a tuple of
+    :code:`(view, status, latency, pool_wait, db_time, commit_time)` to
+    results for each
+    """
+    rng = random.Random()
+    views = [view for view, weight in sorted(MIX.items())
+             for _ in range(weight)]
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    conn = HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.time() < deadline:
+        view = rng.choice(views)
+        method, path, body = request_for(view, rng, rows)
+        start = clock()
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception:
+            conn.close()
+            results.append((view, 0, clock() - start, 0.0, 0.0, 0.0))
+            continue
+        results.append((
+            view, response.status, clock() - start,
+            float(response.getheader('X-Pool-Wait', 0)),
+            float(response.getheader('X-DB-Time', 0)),
+            float(response.getheader('X-Commit-Time', 0))))
+    conn.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(concurrency, duration, results):
+    print('concurrency: %d' % concurrency)
+    print('%-8s %8s %8s %8s %8s %8s %8s %6s %6s %9s %9s %9s' % (
+        'view', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms',
+        '4xx', '5xx', 'pool ms', 'db ms', 'commit ms'))
+    views = sorted(MIX) + ['total']
+    for view in views:
+        rows = [r for r in results if view in ('total', r[0])]
+        if not rows:
+            continue
+        latencies = sorted(r[2] for r in rows)
+        print((
+            '%-8s %8d %8.1f %8.1f %8.1f %8.1f %8.1f %6d %6d %9.2f %9.2f %9.2f'
+        ) % (
+            view, len(rows), len(rows) / duration,
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.95) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            latencies[-1] * 1000,
+            sum(1 for r in rows if 400 <= r[1] < 500),
+            sum(1 for r in rows if r[1] >= 500 or r[1] == 0),
+            sum(r[3] for r in rows) / len(rows) * 1000,
+            sum(r[4] for r in rows) / len(rows) * 1000,
+            sum(r[5] for r in rows) / len(rows) * 1000))
+    print('')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--concurrency', default='1,4,16,64',
+        help='comma separated numbers of concurrent clients')
+    parser.add_argument(
+        '--duration', type=float, default=10,
+        help='seconds to run for each concurrency level')
+    parser.add_argument(
+        '--processes', type=int, default=1,
+        help='number of server processes, multi-threaded server if 1')
+    parser.add_argument(
+        '--rows', type=int, default=1000, help='number of initial users')
+    parser.add_argument(
+        '--database', help='SQLAlchemy database URL, '
+        'a temporary SQLite database file by default')
+    args = parser.parse_args()
+
+    tmpdir = None
+    database = args.database
+    if database is None:
+        tmpdir = tempfile.mkdtemp()
+        database = 'sqlite:///' + os.path.join(tmpdir, 'loadtest.db')
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(database, args.processes, ports))
+    server.daemon = True
+    server.start()
+    try:
+        port = ports.get(timeout=30)
+        for concurrency in map(int, args.concurrency.split(',')):
+            # same initial data for every level, regardless of previous writes
+            setup_database(database, args.rows)
+            results = []
+            deadline = time.time() + args.duration
+            clients = [
+                threading.Thread(
+                    target=client,
+                    args=(port, args.rows, deadline, results))
+                for _ in range(concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            report(concurrency, args.duration, results)
+    finally:
+        server.terminate()
+        server.join()
+        if tmpdir is not None:
+            os.remove(os.path.join(tmpdir, 'loadtest.db'))
+            os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
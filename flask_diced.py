@@ -1,17 +1,72 @@
 # -*- coding: utf-8 -*-
 """Flask-Diced - CRUD views generator for Flask"""
 
-from flask import flash, redirect, render_template, url_for
+import codecs
+import csv
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:  # pragma: no cover
+    from Queue import Empty, Full, Queue
+
+from flask import (
+    Response, abort, flash, json, redirect, render_template, request,
+    stream_with_context, url_for,
+)
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from werkzeug.routing import BuildError
+
+try:
+    from sqlalchemy.exc import DataError, IntegrityError
+except ImportError:  # pragma: no cover
+    _SAVE_ERRORS = ()
+else:
+    _SAVE_ERRORS = (DataError, IntegrityError)
 
 
 __version__ = '0.4.dev0'
 
 __all__ = [
     'Detail', 'Index', 'Create', 'Edit', 'Delete',
+    'Export', 'Import', 'Live',
     'Base', 'Diced',
-    'persistence_methods',
+    'Broker', 'TokenBucket',
+    'persistence_methods', 'pk_url_builder',
 ]
 
+#: HTTP methods not subject to admission control
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_clock = getattr(time, 'monotonic', time.time)
+
+_URL_PROBE = 9876543210123
+
+PY2 = sys.version_info[0] == 2
+
+_text_type = type(u'')
+
+if PY2:  # pragma: no cover
+    # csv module of Python 2 works with byte strings only
+    def _to_csv(value):
+        return value.encode('utf-8') if isinstance(value, unicode) else value  # noqa
+
+    def _from_csv(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+else:
+    def _to_csv(value):
+        return value
+
+    _from_csv = _to_csv
+
 
 def apply_decorators(func, decorators):
     for decorator in reversed(decorators):
@@ -19,35 +74,283 @@ def apply_decorators(func, decorators):
     return func
 
 
+def pk_url_builder(endpoint):
+    """returns a function that builds URL for endpoint with :code:`pk`
+
+    the returned function builds the same URL as
+    :code:`url_for(endpoint, pk=pk)`, but for non-negative integer
+    :code:`pk`, by substituting it into a URL template compiled with a probe
+    value, instead of going through URL map for every call.  the template is
+    verified against :func:`~flask.url_for` and not used if they differ,
+    e.g., with fixed digits integer converter, or cannot be built with
+    :code:`pk` alone.  the template is compiled on the first call, and URLs
+    depend on the current request, so the returned function should not
+    outlive it.
+
+    :param endpoint:
+        the endpoint of the URL rule, which has :code:`pk` as argument.
+    """
+    template = []
+
+    def compile_template():
+        probe = str(_URL_PROBE)
+        try:
+            prefix, _, suffix = url_for(
+                endpoint, pk=_URL_PROBE).partition(probe)
+            if probe in suffix or (
+                    prefix + '0' + suffix != url_for(endpoint, pk=0)):
+                return None
+        except BuildError:
+            return None
+        return prefix, suffix
+
+    def build_url(pk):
+        if not template:
+            template.append(compile_template())
+        if template[0] is None or type(pk) is not int or pk < 0:
+            return url_for(endpoint, pk=pk)
+        prefix, suffix = template[0]
+        return prefix + str(pk) + suffix
+    return build_url
+
+
+def admission_control(view, concurrency_limit=None, rate_limit=None,
+                      retry_after=1):
+    """wraps view function with admission control for unsafe requests
+
+    requests with methods in :data:`SAFE_METHODS` are always admitted.
+
+    :param view:
+        the view function to be wrapped.
+
+    :param concurrency_limit:
+        the maximum number of requests handled concurrently, requests over
+        the limit are rejected with 503 instead of being queued.
+
+    :param rate_limit:
+        a :code:`(rate, burst)` tuple, the number of requests admitted per
+        second and the maximum burst size, or an object with the same
+        :meth:`~TokenBucket.consume` method as :class:`TokenBucket`, e.g., one
+        backed by a shared store, requests over the limit are rejected with
+        429.
+
+    :param retry_after:
+        the value of Retry-After header, in seconds, for requests rejected
+        due to concurrency limit.
+    """
+    if concurrency_limit is None and rate_limit is None:
+        return view
+    semaphore = None
+    if concurrency_limit is not None:
+        semaphore = threading.BoundedSemaphore(concurrency_limit)
+    bucket = rate_limit
+    if isinstance(rate_limit, (list, tuple)):
+        bucket = TokenBucket(*rate_limit)
+
+    def admitted_view(*args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return view(*args, **kwargs)
+        if semaphore is not None and not semaphore.acquire(False):
+            return _reject(ServiceUnavailable, retry_after)
+        try:
+            if bucket is not None:
+                wait = bucket.consume()
+                if wait:
+                    return _reject(TooManyRequests, int(math.ceil(wait)))
+            return view(*args, **kwargs)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+    return admitted_view
+
+
+def _reject(exception_class, retry_after):
+    """returns error response of exception_class with Retry-After header"""
+    response = exception_class().get_response()
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _gzip_stream(chunks):
+    """compresses an iterable of bytes into gzip format on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _LineBuffer(list):
+    """minimal file-like object collecting lines written by csv writer"""
+    write = list.append
+
+
+class _Subscription(Queue):
+    """queue of :code:`(event_id, message)` tuples of a subscriber"""
+
+    #: set when a message could not be queued, as the queue was full
+    dropped = False
+
+
+class Broker(object):
+    """in-process publish/subscribe broker for :class:`Live` mixin
+
+    each message is assigned an event id, unique to this broker and
+    increasing per channel.  each subscriber has its own queue of at most
+    :code:`maxsize` messages, messages published to subscribers with full
+    queue are dropped, instead of blocking the publisher, and the queue's
+    :code:`dropped` attribute is set so that the subscriber can tell.
+
+    :param maxsize:
+        the maximum number of pending messages per subscriber.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.subscribers = {}
+        self.last_event_ids = {}
+        self.counter = 0
+        self.token = uuid.uuid4().hex[:8]
+        self.lock = threading.Lock()
+
+    def last_event_id(self, channel):
+        """returns the id of the last message published to channel
+
+        :code:`None` if nothing has been published to it.
+        """
+        return self.last_event_ids.get(channel)
+
+    def publish(self, channel, message):
+        """publishes message to all subscribers of channel
+
+        :return:
+            the event id assigned to the message
+        """
+        with self.lock:
+            self.counter += 1
+            event_id = '{}-{}'.format(self.token, self.counter)
+            self.last_event_ids[channel] = event_id
+            queues = list(self.subscribers.get(channel, ()))
+            # queued under the lock so that messages are in order of ids
+            for queue in queues:
+                try:
+                    queue.put_nowait((event_id, message))
+                except Full:
+                    queue.dropped = True
+        return event_id
+
+    def subscribe(self, channel):
+        """returns a new subscription to channel
+
+        the subscription is a queue of :code:`(event_id, message)` tuples, with
+        attribute :code:`dropped` set when messages are dropped.
+        """
+        queue = _Subscription(self.maxsize)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        """cancels subscription returned by :meth:`subscribe`"""
+        with self.lock:
+            queues = self.subscribers.get(channel, set())
+            queues.discard(queue)
+            if not queues:
+                self.subscribers.pop(channel, None)
+
+
+class TokenBucket(object):
+    """thread-safe in-process token bucket for rate limiting
+
+    :param rate:
+        the number of tokens added to the bucket per second, must be
+        positive.
+
+    :param capacity:
+        the maximum number of tokens in the bucket, i.e., the burst size,
+        defaults to :code:`rate`, but at least one, must be at least one.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if capacity is None:
+            capacity = max(rate, 1)
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        if capacity < 1:
+            raise ValueError('capacity must be at least one')
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.timestamp = _clock()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        """takes one token from the bucket
+
+        :return:
+            0 if a token is taken, otherwise the number of seconds until a
+            token will be available.
+        """
+        with self.lock:
+            now = _clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
 def persistence_methods(datastore):
     """class decorator that adds persistence methods to the model class
 
     :param datastore:
         SQLAlchemy style datastore, should sopport
-        :code:`datastore.session.add()`, :code:`datastore.session.delete()`
-        and :code:`datastore.session.commit()` for model persistence.
+        :code:`datastore.session.add()`, :code:`datastore.session.delete()`,
+        :code:`datastore.session.commit()` and
+        :code:`datastore.session.rollback()` for model persistence, the
+        session is rolled back if commit fails.
 
-    Two persistence methods will be added to the decorated class
+    Three persistence methods will be added to the decorated class
 
     :data:`save(self, commit=True)`
         the save method
 
     :data:`delete(self, commit=True)`
         the delete method
+
+    :data:`save_all(cls, objs, commit=True)`
+        the class method that saves a batch of objects
     """
+    def do_commit():
+        try:
+            datastore.session.commit()
+        except Exception:
+            datastore.session.rollback()
+            raise
+
     def class_decorator(cls):
         def save(self, commit=True):
             datastore.session.add(self)
             if commit:
-                datastore.session.commit()
+                do_commit()
+
+        def save_all(cls, objs, commit=True):
+            datastore.session.add_all(objs)
+            if commit:
+                do_commit()
 
         def delete(self, commit=True):
             datastore.session.delete(self)
             if commit:
-                datastore.session.commit()
+                do_commit()
 
         cls.save = save
         cls.delete = delete
+        cls.save_all = classmethod(save_all)
         return cls
     return class_decorator
 
@@ -111,6 +414,11 @@ class Index(object):
     #: decorators to be applied to index view
     index_decorators = ()
 
+    #: views, if enabled, for which URL builders are provided to index view,
+    #: as variables named :code:`<view>_url`, each takes :code:`pk` and
+    #: returns the same URL as :func:`~flask.url_for` for that view does
+    index_url_views = ('detail', 'edit', 'delete')
+
     #: the endpoint for the index view URL rule
     index_endpoint = 'index'
 
@@ -125,10 +433,24 @@ class Index(object):
         """
         return '{}/{}.html'.format(self.object_name, self.index_endpoint)
 
+    def index_url_builders(self):
+        """returns URL builders for per-object links in index view
+
+        :return:
+            a dict of variable names and functions returned by
+            :func:`pk_url_builder` for :attr:`index_url_views`.
+        """
+        enabled = set(self.views) - set(self.exclude_views)
+        return dict(
+            (view + '_url', pk_url_builder(
+                '.' + getattr(self, view + '_endpoint')))
+            for view in self.index_url_views if view in enabled)
+
     def index_view(self):
         """index view function"""
-        context = self.index_view_context(
-            {self.object_list_name: self.query_all()})
+        context = self.index_url_builders()
+        context[self.object_list_name] = self.query_all()
+        context = self.index_view_context(context)
         return render_template(self.index_template, **context)
 
     def index_view_context(self, context):
@@ -157,6 +479,10 @@ class Index(object):
 class Create(object):
     """create view mixin"""
 
+    #: the maximum number of POST requests handled concurrently by create view,
+    #: requests over the limit are rejected with 503, unlimited if None
+    create_concurrency_limit = None
+
     #: decorators to be applied to create view
     create_decorators = ()
 
@@ -177,6 +503,15 @@ class Create(object):
     #: the name of view to redirect the client to when done
     create_redirect_to_view = '.index'
 
+    #: the rate limit of POST requests to create view, as a tuple of
+    #: :code:`(rate, burst)`, requests over the limit are rejected with 429,
+    #: unlimited if None
+    create_rate_limit = None
+
+    #: the value of Retry-After header, in seconds, of responses rejected for
+    #: :attr:`create_concurrency_limit`
+    create_retry_after = 1
+
     #: the URL rule for the create view
     create_rule = '/create/'
 
@@ -203,6 +538,7 @@ class Create(object):
             obj = self.model()
             form.populate_obj(obj)
             obj.save()
+            self.object_changed('create', obj)
             message = self.create_flash_message
             if message is None:
                 message = self.object_name + ' created'
@@ -231,7 +567,10 @@ class Create(object):
             the Flask Blueprint or Application object to which the create view
             will be registered.
         """
-        view = apply_decorators(self.create_view, self.create_decorators)
+        view = admission_control(
+            apply_decorators(self.create_view, self.create_decorators),
+            self.create_concurrency_limit, self.create_rate_limit,
+            self.create_retry_after)
         blueprint.add_url_rule(
             self.create_rule, self.create_endpoint, view,
             methods=['GET', 'POST'])
@@ -240,6 +579,10 @@ class Create(object):
 class Edit(object):
     """edit view mixin"""
 
+    #: the maximum number of POST requests handled concurrently by edit view,
+    #: requests over the limit are rejected with 503, unlimited if None
+    edit_concurrency_limit = None
+
     #: decorators to be applied to edit view
     edit_decorators = ()
 
@@ -260,6 +603,15 @@ class Edit(object):
     #: the name of view to redirect the client to when done
     edit_redirect_to_view = '.index'
 
+    #: the rate limit of POST requests to edit view, as a tuple of
+    #: :code:`(rate, burst)`, requests over the limit are rejected with 429,
+    #: unlimited if None
+    edit_rate_limit = None
+
+    #: the value of Retry-After header, in seconds, of responses rejected for
+    #: :attr:`edit_concurrency_limit`
+    edit_retry_after = 1
+
     #: the URL rule for the edit view
     edit_rule = '/<int:pk>/edit/'
 
@@ -290,6 +642,7 @@ class Edit(object):
         if form.validate_on_submit():
             form.populate_obj(obj)
             obj.save()
+            self.object_changed('update', obj)
             message = self.edit_flash_message
             if message is None:
                 message = self.object_name + ' updated'
@@ -318,7 +671,10 @@ class Edit(object):
             the Flask Blueprint or Application object to which the edit view
             will be registered.
         """
-        view = apply_decorators(self.edit_view, self.edit_decorators)
+        view = admission_control(
+            apply_decorators(self.edit_view, self.edit_decorators),
+            self.edit_concurrency_limit, self.edit_rate_limit,
+            self.edit_retry_after)
         blueprint.add_url_rule(
             self.edit_rule, self.edit_endpoint, view, methods=['GET', 'POST'])
 
@@ -326,6 +682,18 @@ class Edit(object):
 class Delete(object):
     """delete view mixin"""
 
+    #: the model class of the archive table, with columns of the same names
+    #: as the model's, soft-deleted objects will be moved to it by
+    #: :meth:`archive`
+    archive_model = None
+
+    #: number of rows moved with one commit by :meth:`archive`
+    archive_batch_size = 1000
+
+    #: the maximum number of POST requests handled concurrently by delete view,
+    #: requests over the limit are rejected with 503, unlimited if None
+    delete_concurrency_limit = None
+
     #: decorators to be applied to delete view
     delete_decorators = ()
 
@@ -346,6 +714,15 @@ class Delete(object):
     #: the name of view to redirect the client to when done
     delete_redirect_to_view = '.index'
 
+    #: the rate limit of POST requests to delete view, as a tuple of
+    #: :code:`(rate, burst)`, requests over the limit are rejected with 429,
+    #: unlimited if None
+    delete_rate_limit = None
+
+    #: the value of Retry-After header, in seconds, of responses rejected for
+    #: :attr:`delete_concurrency_limit`
+    delete_retry_after = 1
+
     #: the URL rule for the delete view
     delete_rule = '/<int:pk>/delete/'
 
@@ -374,7 +751,12 @@ class Delete(object):
         obj = self.query_object(pk)
         form = self.delete_form_class(obj=obj)
         if form.validate_on_submit():
-            obj.delete()
+            if self.soft_delete_column is None:
+                obj.delete()
+            else:
+                setattr(obj, self.soft_delete_column, datetime.utcnow())
+                obj.save()
+            self.object_changed('delete', obj)
             message = self.delete_flash_message
             if message is None:
                 message = self.object_name + ' deleted'
@@ -396,6 +778,80 @@ class Delete(object):
         """
         return context
 
+    def archive(self, before=None):
+        """moves soft-deleted rows to the table of :attr:`archive_model`
+
+        rows are moved in batches of :attr:`archive_batch_size` rows, in
+        order of primary key, one transaction per batch, so that it can be
+        run while the application is serving requests, preferably off-peak,
+        the transaction is rolled back if a batch fails.
+
+        :param before:
+            if given, only rows soft-deleted before this datetime are moved.
+
+        :return:
+            the number of moved rows
+        """
+        session = self.model.query.session
+        table = self.model.__table__
+        (pk,) = table.primary_key.columns
+        deleted_at = table.columns[self.soft_delete_column]
+        criteria = [deleted_at.isnot(None)]
+        if before is not None:
+            criteria.append(deleted_at < before)
+        names = self.column_names
+        columns = [table.columns[name] for name in names]
+        count = 0
+        last_pk = None
+        while True:
+            # keyset pagination, instead of scanning from the start each time
+            query = session.query(pk).filter(*criteria)
+            if last_pk is not None:
+                query = query.filter(pk > last_pk)
+            try:
+                pks = [row[0] for row in query.order_by(pk).limit(
+                    self.archive_batch_size).with_for_update()]
+                if not pks:
+                    session.rollback()
+                    return count
+                # criteria repeated, not to move rows restored meanwhile
+                selected = [pk.in_(pks)] + criteria
+                rows = session.query(*columns).filter(*selected)
+                session.execute(
+                    self.archive_model.__table__.insert().from_select(
+                        names, rows.statement))
+                delete = table.delete()
+                for criterion in selected:
+                    delete = delete.where(criterion)
+                count += session.execute(delete).rowcount
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            last_pk = pks[-1]
+
+    def register_archive_command(self, app):
+        """register :meth:`archive` as a command of Flask CLI
+
+        the command is named :code:`archive-<object_name>`, with an optional
+        :code:`--days` option to only move rows soft-deleted earlier than that
+        many days ago.
+
+        :param app:
+            the Flask Application object to which the command will be
+            registered.
+        """
+        import click
+
+        @app.cli.command('archive-' + self.object_name)
+        @click.option('--days', type=float, help='minimum age in days')
+        def archive_command(days):
+            before = None
+            if days is not None:
+                before = datetime.utcnow() - timedelta(days=days)
+            click.echo('{} {} archived'.format(
+                self.archive(before), self.object_name))
+
     def register_delete_view(self, blueprint):
         """register delete view to blueprint
 
@@ -403,12 +859,607 @@ class Delete(object):
             the Flask Blueprint or Application object to which the delete view
             will be registered.
         """
-        view = apply_decorators(self.delete_view, self.delete_decorators)
+        view = admission_control(
+            apply_decorators(self.delete_view, self.delete_decorators),
+            self.delete_concurrency_limit, self.delete_rate_limit,
+            self.delete_retry_after)
         blueprint.add_url_rule(
             self.delete_rule, self.delete_endpoint, view,
             methods=['GET', 'POST'])
 
 
+class Export(object):
+    """export view mixin
+
+    streams all objects as CSV or newline-delimited JSON, rows are fetched
+    from database and sent to client in chunks of :attr:`export_chunk_size`
+    rows, so that no more than one chunk is held in memory at a time.
+    """
+
+    #: number of rows fetched from database and sent to client at a time
+    export_chunk_size = 1000
+
+    #: names of model attributes to be exported, in order, all columns of
+    #: the model's table will be exported if not specified
+    export_columns = None
+
+    #: decorators to be applied to export view
+    export_decorators = ()
+
+    #: the endpoint for the export view URL rule
+    export_endpoint = 'export'
+
+    #: compress the response with gzip on the fly if the client accepts it
+    export_gzip = False
+
+    #: the mimetypes of supported export formats
+    export_mimetypes = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    #: the URL rule for the export view
+    export_rule = '/export.<any(csv, ndjson):fmt>'
+
+    @property
+    def export_column_names(self):
+        """names of model attributes to be exported
+
+        the default value is :attr:`export_columns` if specified, otherwise
+        :attr:`~Base.column_names`.
+        """
+        if self.export_columns is not None:
+            return list(self.export_columns)
+        return self.column_names
+
+    def export_query(self):
+        """returns the query for rows to be exported
+
+        the default implementation projects :attr:`export_column_names` on
+        :meth:`~Base.base_query`, so that only values of exported columns,
+        instead of model objects, are loaded.
+        """
+        columns = [getattr(self.model, name)
+                   for name in self.export_column_names]
+        return self.base_query().with_entities(*columns)
+
+    def export_chunks(self):
+        """yields lists of rows to be exported
+
+        rows are streamed from a server-side cursor where the database driver
+        supports it, each list has at most :attr:`export_chunk_size` rows.
+        """
+        size = self.export_chunk_size
+        chunk = []
+        for row in self.export_query().yield_per(size):
+            chunk.append(tuple(row))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def export_csv(self, columns, chunks):
+        """yields lines of CSV, a chunk at a time
+
+        :param columns:
+            the names of exported columns, written as the header row.
+
+        :param chunks:
+            iterable of lists of rows, as returned by :meth:`export_chunks`.
+        """
+        buf = _LineBuffer()
+        writer = csv.writer(buf)
+        writer.writerow([_to_csv(name) for name in columns])
+        for chunk in chunks:
+            writer.writerows(
+                [_to_csv(value) for value in row] for row in chunk)
+            yield _from_csv(''.join(buf))
+            del buf[:]
+        if buf:
+            yield _from_csv(''.join(buf))
+
+    def export_ndjson(self, columns, chunks):
+        """yields lines of newline-delimited JSON, a chunk at a time
+
+        :param columns:
+            the names of exported columns, used as keys of JSON objects.
+
+        :param chunks:
+            iterable of lists of rows, as returned by :meth:`export_chunks`.
+        """
+        for chunk in chunks:
+            yield ''.join(
+                json.dumps(dict(zip(columns, row))) + '\n' for row in chunk)
+
+    def export_view(self, fmt):
+        """export view function
+
+        :param fmt:
+            the format of exported data, either :code:`'csv'` or
+            :code:`'ndjson'` by default, responds with 404 if it is not one of
+            :attr:`export_mimetypes`.
+        """
+        if fmt not in self.export_mimetypes:
+            abort(404)
+        columns = self.export_column_names
+        serialize = getattr(self, 'export_' + fmt)
+        body = (text.encode('utf-8')
+                for text in serialize(columns, self.export_chunks()))
+        headers = {
+            'Content-Disposition': 'attachment; filename={}.{}'.format(
+                self.object_name, fmt),
+        }
+        if self.export_gzip:
+            headers['Vary'] = 'Accept-Encoding'
+            if request.accept_encodings['gzip'] > 0:
+                headers['Content-Encoding'] = 'gzip'
+                body = _gzip_stream(body)
+        return Response(
+            stream_with_context(body), headers=headers,
+            mimetype=self.export_mimetypes[fmt])
+
+    def register_export_view(self, blueprint):
+        """register export view to blueprint
+
+        :param blueprint:
+            the Flask Blueprint or Application object to which the export view
+            will be registered.
+        """
+        view = apply_decorators(self.export_view, self.export_decorators)
+        blueprint.add_url_rule(self.export_rule, self.export_endpoint, view)
+
+
+class Import(object):
+    """import view mixin
+
+    creates objects from an uploaded CSV or newline-delimited JSON file, the
+    file is parsed as a stream, each row is validated separately and valid
+    objects are saved in batches of :attr:`import_batch_size`, with one
+    commit per batch.
+
+    the model class must have the :code:`save_all` class method, as added
+    by :func:`persistence_methods`, otherwise :meth:`register_import_view`
+    raises :exc:`TypeError`.
+    """
+
+    #: number of objects saved with one commit
+    import_batch_size = 1000
+
+    #: the maximum number of POST requests handled concurrently by import view,
+    #: requests over the limit are rejected with 503, unlimited if None
+    import_concurrency_limit = None
+
+    #: decorators to be applied to import view
+    import_decorators = ()
+
+    #: the endpoint for the import view URL rule
+    import_endpoint = 'import'
+
+    #: the name for variable representing per-row errors in template, a list
+    #: of :code:`(line_number, errors)` tuples
+    import_errors_name = 'errors'
+
+    #: the name of the file field in :attr:`import_form_class`
+    import_file_field = 'file'
+
+    #: the message to be flashed when done, the default message contains the
+    #: number of imported objects
+    import_flash_message = None
+
+    #: the form class for uploading file, with Flask-WTF compatible API,
+    #: this attribute is **mandatory** if import view is enabled unless the
+    #: default view :meth:`import_view` is overridden and does not use it
+    import_form_class = None
+
+    #: the name for variable representing the form in template
+    import_form_name = 'form'
+
+    #: the import formats, keyed by extension of the uploaded file name
+    import_formats = {'.csv': 'csv', '.jsonl': 'ndjson', '.ndjson': 'ndjson'}
+
+    #: the name of view to redirect the client to when done
+    import_redirect_to_view = '.index'
+
+    #: the rate limit of POST requests to import view, as a tuple of
+    #: :code:`(rate, burst)`, requests over the limit are rejected with 429,
+    #: unlimited if None
+    import_rate_limit = None
+
+    #: the value of Retry-After header, in seconds, of responses rejected for
+    #: :attr:`import_concurrency_limit`
+    import_retry_after = 1
+
+    #: the form class for validating each row, with Flask-WTF compatible API,
+    #: :attr:`~Create.create_form_class` will be used if not specified
+    import_row_form_class = None
+
+    #: exceptions raised by the datastore when some objects of a batch cannot
+    #: be saved, the batch will then be saved one object at a time, and
+    #: objects failing with these exceptions reported, other exceptions are
+    #: propagated, the default are integrity and data errors of SQLAlchemy
+    import_save_errors = _SAVE_ERRORS
+
+    #: the URL rule for the import view
+    import_rule = '/import/'
+
+    @property
+    def import_redirect_url(self):
+        """the url the client will be redirected to when done
+
+        the default value is the url of :attr:`import_redirect_to_view`
+        """
+        return url_for(self.import_redirect_to_view)
+
+    @property
+    def import_template(self):
+        """default template name for import view
+
+        generated with :attr:`~Base.object_name` and :attr:`import_endpoint`
+        """
+        return '{}/{}.html'.format(self.object_name, self.import_endpoint)
+
+    def import_csv(self, lines):
+        """yields :code:`(line_number, row)` tuples parsed from CSV
+
+        :param lines:
+            iterable of lines of CSV, the first line is the header row.
+        """
+        reader = csv.DictReader(
+            (_to_csv(line) for line in lines), strict=True)
+        for row in reader:
+            yield reader.line_num, dict(
+                (_from_csv(k), _from_csv(v)) for (k, v) in row.items())
+
+    def import_ndjson(self, lines):
+        """yields :code:`(line_number, row)` tuples parsed from NDJSON
+
+        :param lines:
+            iterable of lines of newline-delimited JSON, blank lines are
+            ignored, row is :code:`None` if the line is not valid JSON.
+        """
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row
+
+    def import_object(self, row):
+        """validates a row and creates an object out of it
+
+        :param row:
+            the dict of field names and values parsed from uploaded file.
+
+        :return:
+            a tuple of :code:`(obj, errors)`, :code:`obj` is :code:`None` if
+            the row is invalid, and :code:`errors` is a dict of field names
+            and lists of error messages in that case.
+        """
+        if not isinstance(row, dict):
+            return None, {'row': ['not a valid object']}
+        invalid = [k for (k, v) in row.items() if isinstance(v, (dict, list))]
+        if invalid:
+            return None, dict(
+                (k if k is not None else 'row', ['not a valid value'])
+                for k in invalid)
+        form_class = self.import_row_form_class or self.create_form_class
+        # form data is always text, as if submitted by browser
+        form = form_class(
+            formdata=MultiDict(
+                (k, v if isinstance(v, _text_type) else json.dumps(v))
+                for (k, v) in row.items() if v is not None),
+            meta={'csrf': False})
+        if not form.validate():
+            return None, form.errors
+        obj = self.model()
+        form.populate_obj(obj)
+        return obj, {}
+
+    def import_parse(self, fmt, stream, file_errors):
+        """yields :code:`(line_number, row)` tuples parsed from uploaded file
+
+        parsing stops at the first line that is not valid UTF-8 or, for CSV,
+        is malformed, with error message appended to :code:`file_errors`.
+
+        :param fmt:
+            the format of the file, one of values of :attr:`import_formats`.
+
+        :param stream:
+            the binary stream of the uploaded file.
+
+        :param file_errors:
+            the list to which error message will be appended.
+        """
+        line_number = None
+        rows = getattr(self, 'import_' + fmt)(
+            codecs.iterdecode(stream, 'utf-8-sig'))
+        try:
+            for line_number, row in rows:
+                yield line_number, row
+        except (UnicodeDecodeError, csv.Error) as e:
+            if isinstance(e, UnicodeDecodeError):
+                message = 'not valid UTF-8'
+            else:
+                message = 'malformed CSV: {}'.format(e)
+            if line_number is not None:
+                message += ', after line {}'.format(line_number)
+            file_errors.append(message)
+
+    def import_batch(self, batch, errors):
+        """saves a batch of objects with one commit
+
+        if that fails with one of :attr:`import_save_errors`, objects are
+        saved one by one, so that the ones that cannot be saved, e.g., for
+        violating unique constraints, are reported.
+
+        :param batch:
+            list of :code:`(line_number, obj)` tuples.
+
+        :param errors:
+            the list to which :code:`(line_number, errors)` tuples of objects
+            that cannot be saved will be appended.
+
+        :return:
+            the number of saved objects
+        """
+        try:
+            self.model.save_all([obj for (_, obj) in batch])
+            return len(batch)
+        except self.import_save_errors:
+            pass
+        count = 0
+        for line_number, obj in batch:
+            try:
+                obj.save()
+            except self.import_save_errors:
+                errors.append((line_number, {'row': ['cannot be saved']}))
+            else:
+                count += 1
+        return count
+
+    def import_rows(self, rows, errors):
+        """validates and saves rows in batches
+
+        :param rows:
+            iterable of :code:`(line_number, row)` tuples.
+
+        :param errors:
+            the list to which :code:`(line_number, errors)` tuples of invalid
+            rows will be appended.
+
+        :return:
+            the number of saved objects
+        """
+        count = 0
+        batch = []
+        for line_number, row in rows:
+            obj, row_errors = self.import_object(row)
+            if row_errors:
+                errors.append((line_number, row_errors))
+                continue
+            batch.append((line_number, obj))
+            if len(batch) >= self.import_batch_size:
+                count += self.import_batch(batch, errors)
+                batch = []
+        if batch:
+            count += self.import_batch(batch, errors)
+        return count
+
+    def import_view(self):
+        """import view function
+
+        redirects when all rows are imported, otherwise renders the template
+        with per-row errors and errors of the file field, valid rows before
+        the first unparsable line are imported regardless.
+        """
+        form = self.import_form_class()
+        errors = []
+        if form.validate_on_submit():
+            field = form[self.import_file_field]
+            filename = getattr(field.data, 'filename', None)
+            fmt = None
+            if not filename:
+                field.errors.append('no file uploaded')
+            else:
+                extension = os.path.splitext(filename)[1].lower()
+                fmt = self.import_formats.get(extension)
+                if fmt is None:
+                    field.errors.append('unsupported file format')
+            if fmt is not None:
+                rows = self.import_parse(fmt, field.data.stream, field.errors)
+                count = self.import_rows(rows, errors)
+                message = self.import_flash_message
+                if message is None:
+                    message = '{} {} imported'.format(count, self.object_name)
+                if message:
+                    flash(message)
+                if not errors and not field.errors:
+                    return redirect(self.import_redirect_url)
+        context = self.import_view_context({
+            self.import_form_name: form,
+            self.import_errors_name: errors,
+        })
+        return render_template(self.import_template, **context)
+
+    def import_view_context(self, context):
+        """import view context
+
+        :param context:
+            the context that will be provided to import view, can be modified
+            as needed.
+
+        :return:
+            the context to be used for import view
+        """
+        return context
+
+    def register_import_view(self, blueprint):
+        """register import view to blueprint
+
+        :param blueprint:
+            the Flask Blueprint or Application object to which the import view
+            will be registered.
+        """
+        if not hasattr(self.model, 'save_all'):
+            raise TypeError(
+                '{} has no save_all method, required by import view'.format(
+                    self.model.__name__))
+        view = admission_control(
+            apply_decorators(self.import_view, self.import_decorators),
+            self.import_concurrency_limit, self.import_rate_limit,
+            self.import_retry_after)
+        blueprint.add_url_rule(
+            self.import_rule, self.import_endpoint, view,
+            methods=['GET', 'POST'])
+
+
+class Live(object):
+    """live view mixin
+
+    publishes changes made by views, as :meth:`~Base.object_changed` is
+    called, to :attr:`live_broker`, and streams them to clients as
+    Server-Sent Events, with the action as event type and a JSON object with
+    keys :code:`action` and :code:`object` as data.
+
+    every event has an id, when events are missed, as the client fell
+    behind and its messages were dropped, or it reconnected with a
+    :code:`Last-Event-ID` other than the last one published, a
+    :code:`resync` event is sent instead, and the client should reload the
+    listing, as incremental updates can no longer be applied to it.
+
+    this mixin overrides :meth:`~Base.object_changed`, so it must precede
+    :class:`Base` and classes derived from it, e.g., :class:`Diced`, in base
+    classes, as in :code:`class UserView(Live, Diced)`, otherwise
+    :meth:`register_live_view` raises :exc:`TypeError`.
+    """
+
+    #: the broker events are published to and subscribed from, with the same
+    #: API as :class:`Broker`, including event ids and :code:`dropped` flag
+    #: of subscriptions, shared by all instances by default
+    live_broker = Broker()
+
+    #: names of model attributes to be sent in events,
+    #: :attr:`~Base.column_names` will be used if not specified
+    live_columns = None
+
+    #: decorators to be applied to live view
+    live_decorators = ()
+
+    #: the endpoint for the live view URL rule
+    live_endpoint = 'live'
+
+    #: the interval, in seconds, of keep-alive comments sent to client when
+    #: there is no event
+    live_keepalive = 15
+
+    #: the reconnection time, in milliseconds, for client
+    live_retry = 3000
+
+    #: the URL rule for the live view
+    live_rule = '/live/'
+
+    @property
+    def live_channel(self):
+        """the channel of the broker to which events are published
+
+        generated with the module and name of :attr:`~Base.model` in default
+        implementation, so all instances for the same model, in all processes
+        sharing the broker, publish to and stream from the same channel,
+        override this to separate them.
+        """
+        return '{}.{}'.format(self.model.__module__, self.model.__name__)
+
+    def object_changed(self, action, obj):
+        """publishes the change to :attr:`live_broker`"""
+        super(Live, self).object_changed(action, obj)
+        columns = self.live_columns
+        if columns is None:
+            columns = self.column_names
+        data = json.dumps({
+            'action': action,
+            'object': dict((name, getattr(obj, name)) for name in columns),
+        })
+        message = 'event: {}\ndata: {}\n\n'.format(action, data)
+        self.live_broker.publish(self.live_channel, message)
+
+    def live_resync_event(self):
+        """returns the :code:`resync` event
+
+        with the id of the last published event, if any, so that the client
+        reconnecting after reloading will not be asked to resync again.
+        """
+        event_id = self.live_broker.last_event_id(self.live_channel)
+        event = 'event: resync\ndata: {}\n\n'
+        if event_id is None:
+            return event
+        return 'id: {}\n{}'.format(event_id, event)
+
+    def live_events(self, queue):
+        """yields events from subscription and keep-alive comments
+
+        a :code:`resync` event is yielded in place of pending events if some
+        were dropped.
+
+        :param queue:
+            the subscription returned by :attr:`live_broker`.
+        """
+        while True:
+            if queue.dropped:
+                queue.dropped = False
+                while True:
+                    try:
+                        queue.get_nowait()
+                    except Empty:
+                        break
+                yield self.live_resync_event()
+                continue
+            try:
+                event_id, message = queue.get(timeout=self.live_keepalive)
+            except Empty:
+                yield ':\n\n'
+            else:
+                yield 'id: {}\n{}'.format(event_id, message)
+
+    def live_view(self):
+        """live view function"""
+        broker = self.live_broker
+        channel = self.live_channel
+        last_event_id = request.headers.get('Last-Event-ID')
+
+        def stream():
+            queue = broker.subscribe(channel)
+            try:
+                yield 'retry: {}\n\n'.format(self.live_retry)
+                if last_event_id is not None and (
+                        last_event_id != broker.last_event_id(channel)):
+                    yield self.live_resync_event()
+                for event in self.live_events(queue):
+                    yield event
+            finally:
+                broker.unsubscribe(channel, queue)
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(
+            stream(), headers=headers, mimetype='text/event-stream')
+
+    def register_live_view(self, blueprint):
+        """register live view to blueprint
+
+        :param blueprint:
+            the Flask Blueprint or Application object to which the live view
+            will be registered.
+        """
+        mro = type(self).__mro__
+        if Base in mro and mro.index(Base) < mro.index(Live):
+            raise TypeError(
+                '{} must precede {} in base classes of {}'.format(
+                    Live.__name__, Base.__name__, type(self).__name__))
+        view = apply_decorators(self.live_view, self.live_decorators)
+        blueprint.add_url_rule(self.live_rule, self.live_endpoint, view)
+
+
 class Base(object):
     """base class with properties and methods used by mixins"""
 
@@ -422,6 +1473,18 @@ class Base(object):
     #: the model class, this attribute is **mandatory**
     model = None
 
+    #: the name of the datetime column marking objects as soft-deleted,
+    #: if set, delete view sets it instead of deleting objects, and objects
+    #: with it set are filtered out by :meth:`base_query`, with
+    #: :code:`IS NULL` criterion, which can use partial index with the same
+    #: predicate
+    soft_delete_column = None
+
+    @property
+    def column_names(self):
+        """names of all columns of the model's table"""
+        return [column.key for column in self.model.__table__.columns]
+
     @property
     def object_list_name(self):
         """default name for variable representing list of objects in templates
@@ -447,13 +1510,37 @@ class Base(object):
         self.__dict__.update(
             (k, v) for (k, v) in options.items() if not k.startswith('__'))
 
+    def base_query(self):
+        """returns the query other queries are built upon
+
+        override this to apply filtering shared by all views.
+        """
+        query = self.model.query
+        if self.soft_delete_column is not None:
+            query = query.filter(
+                getattr(self.model, self.soft_delete_column).is_(None))
+        return query
+
+    def object_changed(self, action, obj):
+        """called by views when an object is created, updated or deleted
+
+        does nothing in default implementation.
+
+        :param action:
+            one of :code:`'create'`, :code:`'update'` and :code:`'delete'`.
+
+        :param obj:
+            the object created, updated or deleted.
+        """
+
     def query_object(self, pk):
         """returns the object with matching :code:`pk`"""
-        return self.model.query.get_or_404(pk)
+        (column,) = self.model.__table__.primary_key.columns
+        return self.base_query().filter(column == pk).first_or_404()
 
     def query_all(self):
         """returns all objects"""
-        return self.model.query.all()
+        return self.base_query().all()
 
     def register(self, blueprint):
         """register all enabled views to the :code:`blueprint`
@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 # NOTE: to run the tests, please get development source code with examples
+import io
+import json
 import os
 import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
 
-from flask import url_for
+from flask import Blueprint, request, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import BuildError
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField
+from sqlalchemy.exc import IntegrityError
 
 import pytest
 
@@ -11,7 +21,119 @@ import pytest
 PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
 sys.path.insert(0, os.path.join(PROJECT_DIR, 'examples', 'simple'))
 
-from app import User, app as example_app, db  # noqa
+from app import (  # noqa
+    CreateUserForm, DeleteForm, EditUserForm, User, app as example_app, db)
+from flask_diced import (  # noqa
+    Base, Create, Delete, Detail, Diced, Edit, Export, Import, Index, Live,
+    Broker, TokenBucket, persistence_methods, pk_url_builder)
+
+
+class UserExport(Export, Base):
+    model = User
+    views = {'export'}
+    export_chunk_size = 2
+    export_columns = ['id', 'username']
+    export_gzip = True
+
+
+export_blueprint = Blueprint('export', __name__)
+UserExport().register(export_blueprint)
+UserExport(
+    export_endpoint='export_any', export_rule='/any/export.<fmt>',
+).register(export_blueprint)
+example_app.register_blueprint(export_blueprint, url_prefix='/exports')
+
+
+class UploadForm(FlaskForm):
+    file = FileField('File')
+
+
+class UserImport(Import, Base):
+    model = User
+    views = {'import'}
+    create_form_class = CreateUserForm
+    import_batch_size = 2
+    import_form_class = UploadForm
+    import_redirect_to_view = 'index'
+
+
+import_blueprint = Blueprint('import', __name__, template_folder='templates')
+UserImport().register(import_blueprint)
+example_app.register_blueprint(import_blueprint, url_prefix='/imports')
+
+
+entered = threading.Event()
+release = threading.Event()
+
+
+def blocking_decorator(view):
+    def blocking_view(*args, **kwargs):
+        if request.method == 'POST':
+            entered.set()
+            release.wait(5)
+        return 'done'
+    return blocking_view
+
+
+class LimitedUserView(Create, Edit, Base):
+    model = User
+    views = {'create', 'edit'}
+    create_form_class = CreateUserForm
+    create_rate_limit = (1, 1)
+    create_redirect_to_view = 'index'
+    edit_concurrency_limit = 1
+    edit_decorators = [blocking_decorator]
+    edit_rate_limit = (0.001, 2)
+    edit_retry_after = 5
+
+
+limited_blueprint = Blueprint('limited', __name__)
+LimitedUserView().register(limited_blueprint)
+example_app.register_blueprint(limited_blueprint, url_prefix='/limited')
+
+
+class LiveUserView(Live, Diced):
+    model = User
+    views = Diced.views | {'live'}
+    create_form_class = CreateUserForm
+    edit_form_class = EditUserForm
+    delete_form_class = DeleteForm
+    live_columns = ['id', 'username']
+
+
+live_blueprint = Blueprint('live', __name__)
+LiveUserView().register(live_blueprint)
+example_app.register_blueprint(live_blueprint, url_prefix='/live')
+
+
+@persistence_methods(db)
+class Note(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(80))
+    deleted_at = db.Column(db.DateTime)
+
+
+class NoteArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(80))
+    deleted_at = db.Column(db.DateTime)
+
+
+class NoteView(Delete, Base):
+    model = Note
+    views = {'delete'}
+    archive_model = NoteArchive
+    archive_batch_size = 2
+    delete_form_class = DeleteForm
+    delete_redirect_to_view = 'index'
+    soft_delete_column = 'deleted_at'
+
+
+note_view = NoteView()
+note_blueprint = Blueprint('note', __name__)
+note_view.register(note_blueprint)
+note_view.register_archive_command(example_app)
+example_app.register_blueprint(note_blueprint, url_prefix='/notes')
 
 
 USERNAME = 'John Doe'
@@ -55,6 +177,66 @@ def test_index_view(app, user):
         assert EMAIL in html
 
 
+def test_index_view_links(app, user):
+    with app.test_client() as client:
+        response = client.get(url_for('live.index'))
+        html = response.data.decode()
+        for endpoint in ['live.detail', 'live.edit', 'live.delete']:
+            assert 'href="%s"' % url_for(endpoint, pk=user.id) in html
+
+
+def test_pk_url_builder(app):
+    with app.test_request_context(base_url='http://localhost/root/'):
+        for endpoint in ['detail', 'live.edit']:
+            build_url = pk_url_builder(endpoint)
+            for pk in [0, 1, 42, 9876543210123, -1, '7']:
+                assert build_url(pk) == url_for(endpoint, pk=pk)
+
+
+class FilteredUserView(Diced):
+    model = User
+
+    def base_query(self):
+        query = super(FilteredUserView, self).base_query()
+        return query.filter(User.username != 'hidden')
+
+
+def test_query_object_with_filtered_base_query(app, user):
+    hidden = User(username='hidden', email='hidden@example.com')
+    hidden.save()
+    view = FilteredUserView()
+    assert view.query_object(user.id) is user
+    with pytest.raises(NotFound):
+        view.query_object(hidden.id)
+    assert view.query_all() == [user]
+
+
+class SluggedUserView(Detail, Index, Base):
+    model = User
+    views = {'detail', 'index'}
+    detail_rule = '/<int:pk>/<slug>/'
+    index_template = 'user/plain_index.html'
+
+
+slugged_blueprint = Blueprint(
+    'slugged', __name__, template_folder='templates')
+SluggedUserView().register(slugged_blueprint)
+example_app.register_blueprint(slugged_blueprint, url_prefix='/slugged')
+
+
+def test_index_view_with_unused_url_builder(app, user):
+    with app.test_client() as client:
+        response = client.get(url_for('slugged.index'))
+        assert response.status_code == 200
+        assert USERNAME in response.data.decode()
+
+
+def test_pk_url_builder_needing_other_values(app):
+    build_url = pk_url_builder('slugged.detail')
+    with pytest.raises(BuildError):
+        build_url(1)
+
+
 def test_create_view(app):
     with app.test_client() as client:
         response = client.post(
@@ -131,3 +313,368 @@ def test_delete_view_with_get_should_fail(app, user):
     john = User.query.one()
     assert john.username == USERNAME
     assert john.email == EMAIL
+
+
+def create_users(count):
+    for n in range(count):
+        User(username='user%d' % n, email='user%d@example.com' % n).save()
+
+
+def test_export_view_csv(app):
+    create_users(3)
+    with app.test_client() as client:
+        response = client.get(url_for('export.export', fmt='csv'))
+        assert response.mimetype == 'text/csv'
+        assert 'user.csv' in response.headers['Content-Disposition']
+        lines = response.data.decode().splitlines()
+    assert lines == ['id,username', '1,user0', '2,user1', '3,user2']
+
+
+def test_export_view_csv_with_no_object(app):
+    with app.test_client() as client:
+        response = client.get(url_for('export.export', fmt='csv'))
+        assert response.data.decode().splitlines() == ['id,username']
+
+
+def test_export_view_csv_non_ascii(app):
+    User(username=u'J\xfcrgen', email='juergen@example.com').save()
+    with app.test_client() as client:
+        response = client.get(url_for('export.export', fmt='csv'))
+        lines = response.data.decode('utf-8').splitlines()
+    assert lines == ['id,username', u'1,J\xfcrgen']
+
+
+def test_export_view_unknown_format(app):
+    with app.test_client() as client:
+        for fmt in ['query', 'view', 'xml']:
+            response = client.get(url_for('export.export_any', fmt=fmt))
+            assert response.status_code == 404
+        response = client.get(url_for('export.export_any', fmt='csv'))
+        assert response.status_code == 200
+
+
+def test_export_view_ndjson(app):
+    create_users(3)
+    with app.test_client() as client:
+        response = client.get(url_for('export.export', fmt='ndjson'))
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line)
+                for line in response.data.decode().splitlines()]
+    assert rows == [{'id': n + 1, 'username': 'user%d' % n} for n in range(3)]
+
+
+def test_export_view_gzip_refused(app):
+    create_users(1)
+    with app.test_client() as client:
+        response = client.get(
+            url_for('export.export', fmt='csv'),
+            headers={'Accept-Encoding': 'gzip;q=0, identity'})
+        assert 'Content-Encoding' not in response.headers
+        assert response.data.decode().splitlines()[-1] == '1,user0'
+
+
+def test_export_view_gzip(app):
+    create_users(3)
+    with app.test_client() as client:
+        response = client.get(
+            url_for('export.export', fmt='csv'),
+            headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        data = zlib.decompress(response.data, 16 + zlib.MAX_WBITS).decode()
+    assert data.splitlines()[-1] == '3,user2'
+
+
+def upload(client, filename, content, encoding='utf-8'):
+    return client.post(
+        url_for('import.import'),
+        follow_redirects=True,
+        data=dict(file=(io.BytesIO(content.encode(encoding)), filename)))
+
+
+def test_import_view_csv(app):
+    content = 'username,email\n' + ''.join(
+        'user%d,user%d@example.com\n' % (n, n) for n in range(5))
+    with app.test_client() as client:
+        html = upload(client, 'users.csv', content).data.decode()
+        assert '5 user imported' in html
+    assert [u.username for u in User.query.order_by(User.id)] == [
+        'user%d' % n for n in range(5)]
+
+
+def test_import_view_ndjson(app):
+    content = '\n'.join(
+        json.dumps(dict(username='user%d' % n, email='user%d@example.com' % n))
+        for n in range(3))
+    with app.test_client() as client:
+        html = upload(client, 'users.ndjson', content).data.decode()
+        assert '3 user imported' in html
+    assert User.query.count() == 3
+
+
+def test_import_view_reports_row_errors(app, user):
+    content = '\n'.join([
+        json.dumps(dict(username='user0', email='user0@example.com')),
+        'not json',
+        json.dumps(dict(username=USERNAME, email='jane@example.com')),
+        json.dumps(dict(username='user1', email='invalid')),
+        json.dumps(dict(username='user2', email='user2@example.com')),
+    ])
+    with app.test_client() as client:
+        html = upload(client, 'users.jsonl', content).data.decode()
+        assert '2 user imported' in html
+        assert 'line 1' not in html
+        assert 'line 2' in html
+        assert 'line 3' in html
+        assert 'line 4' in html
+    assert User.query.count() == 3
+
+
+def test_import_view_reports_rows_failed_to_save(app):
+    content = 'username,email\n' + ''.join(
+        '%s,%s@example.com\n' % (name, n)
+        for n, name in enumerate(['a', 'a', 'b', 'c', 'd']))
+    with app.test_client() as client:
+        html = upload(client, 'users.csv', content).data.decode()
+        assert '4 user imported' in html
+        assert 'line 3' in html
+        assert 'cannot be saved' in html
+    assert sorted(u.username for u in User.query) == ['a', 'b', 'c', 'd']
+
+
+def test_import_view_rejects_non_scalar_values(app):
+    content = json.dumps(dict(username=['x', 'y'], email='x@example.com'))
+    with app.test_client() as client:
+        html = upload(client, 'users.ndjson', content).data.decode()
+        assert '0 user imported' in html
+        assert 'line 1' in html
+    assert User.query.count() == 0
+
+
+def test_import_view_csv_non_ascii(app):
+    content = u'username,email\nJ\xfcrgen,juergen@example.com\n'
+    with app.test_client() as client:
+        upload(client, 'users.csv', content)
+    assert User.query.one().username == u'J\xfcrgen'
+
+
+def test_import_view_invalid_utf8(app):
+    content = u'username,email\nuser0,user0@example.com\nJ\xfcrgen,x\n'
+    with app.test_client() as client:
+        html = upload(client, 'users.csv', content, 'latin-1').data.decode()
+        assert 'not valid UTF-8, after line 2' in html
+    assert User.query.count() == 1
+
+
+def test_import_view_malformed_csv(app):
+    content = 'username,email\n"user0"x,user0@example.com\n'
+    with app.test_client() as client:
+        html = upload(client, 'users.csv', content).data.decode()
+        assert 'malformed CSV' in html
+    assert User.query.count() == 0
+
+
+def test_import_view_numeric_values(app):
+    content = json.dumps(dict(username=1, email=2))
+    with app.test_client() as client:
+        html = upload(client, 'users.ndjson', content).data.decode()
+        assert '0 user imported' in html
+        assert 'line 1' in html
+    assert User.query.count() == 0
+
+
+def test_import_view_without_file(app):
+    with app.test_client() as client:
+        response = client.post(
+            url_for('import.import'), follow_redirects=True, data={})
+        assert 'no file uploaded' in response.data.decode()
+
+
+def test_import_batch_propagates_unexpected_errors(app):
+    class BrokenModel(object):
+        @classmethod
+        def save_all(cls, objs):
+            raise ValueError
+
+    with pytest.raises(ValueError):
+        UserImport(model=BrokenModel).import_batch([(1, object())], [])
+
+
+def test_import_requires_save_all(app):
+    class PlainModel(object):
+        def save(self):
+            pass
+
+    with pytest.raises(TypeError):
+        UserImport(model=PlainModel).register(Blueprint('plain', __name__))
+
+
+def test_import_view_unsupported_format(app):
+    with app.test_client() as client:
+        html = upload(client, 'users.txt', 'username').data.decode()
+        assert 'unsupported file format' in html
+    assert User.query.count() == 0
+
+
+def test_rate_limit(app):
+    with app.test_client() as client:
+        url = url_for('limited.create')
+        assert client.get(url).status_code == 200
+        first = client.post(url, data=dict(username=USERNAME, email=EMAIL))
+        assert first.status_code == 302
+        second = client.post(url, data=dict(username='x', email=EMAIL))
+        assert second.status_code == 429
+        assert second.headers['Retry-After'] == '1'
+        assert client.get(url).status_code == 200
+    assert User.query.count() == 1
+
+
+def test_token_bucket_validates_arguments():
+    for rate, capacity in [(0, None), (-1, 1), (1, 0), (1, 0.5)]:
+        with pytest.raises(ValueError):
+            TokenBucket(rate, capacity)
+    assert TokenBucket(0.5).capacity == 1
+
+
+def test_concurrency_limit(app):
+    url = url_for('limited.edit', pk=1)
+    responses = []
+
+    def post():
+        with app.test_client() as client:
+            responses.append(client.post(url))
+
+    entered.clear()
+    release.clear()
+    thread = threading.Thread(target=post)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        with app.test_client() as client:
+            response = client.post(url)
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '5'
+            assert client.get(url).status_code == 200
+    finally:
+        release.set()
+        thread.join()
+    assert responses[0].status_code == 200
+    with app.test_client() as client:
+        # request rejected for concurrency limit does not take a token
+        assert client.post(url).status_code == 200
+        assert client.post(url).status_code == 429
+
+
+def test_live_view(app):
+    with app.test_client() as client:
+        response = client.get(url_for('live.live'), buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        events = iter(response.response)
+        assert next(events) == b'retry: 3000\n\n'
+
+        client.post(
+            url_for('live.create'),
+            data=dict(username=USERNAME, email=EMAIL))
+        client.post(
+            url_for('live.edit', pk=1),
+            data=dict(username='Jane Doe', email='jane@example.com'))
+        client.post(url_for('live.delete', pk=1))
+
+        event_ids = []
+        for action, username in [
+                ('create', USERNAME),
+                ('update', 'Jane Doe'),
+                ('delete', 'Jane Doe')]:
+            event_id, event, data = next(events).decode().splitlines()[:3]
+            assert event_id.startswith('id: ')
+            event_ids.append(event_id)
+            assert event == 'event: ' + action
+            assert json.loads(data[len('data: '):]) == dict(
+                action=action, object=dict(id=1, username=username))
+        response.close()
+        assert len(set(event_ids)) == 3
+
+    assert not LiveUserView.live_broker.subscribers
+
+
+def test_live_view_resync_on_reconnect(app):
+    with app.test_client() as client:
+        response = client.get(
+            url_for('live.live'), buffered=False,
+            headers={'Last-Event-ID': 'stale'})
+        events = iter(response.response)
+        assert next(events) == b'retry: 3000\n\n'
+        assert b'event: resync\n' in next(events)
+        response.close()
+
+
+def test_live_events_resync_on_dropped_messages(app):
+    broker = Broker(maxsize=1)
+    view = LiveUserView(live_broker=broker, live_keepalive=0)
+    queue = broker.subscribe(view.live_channel)
+    broker.publish(view.live_channel, 'event: create\ndata: {}\n\n')
+    last_id = broker.publish(view.live_channel, 'event: create\ndata: {}\n\n')
+    events = view.live_events(queue)
+    assert next(events) == 'id: {}\nevent: resync\ndata: {{}}\n\n'.format(
+        last_id)
+    assert next(events) == ':\n\n'
+    assert broker.last_event_id('other') is None
+
+
+def test_live_channel(app):
+    assert LiveUserView().live_channel == 'app.User'
+
+
+def test_live_must_precede_base(app):
+    class WrongOrderView(Diced, Live):
+        model = User
+        views = {'live'}
+
+    with pytest.raises(TypeError):
+        WrongOrderView().register(Blueprint('wrong_order', __name__))
+
+
+def create_notes(count):
+    for n in range(count):
+        Note(text='note%d' % n).save()
+
+
+def test_soft_delete(app):
+    create_notes(2)
+    with app.test_client() as client:
+        response = client.post(
+            url_for('note.delete', pk=1), follow_redirects=True)
+        assert 'note deleted' in response.data.decode()
+    assert Note.query.get(1).deleted_at is not None
+    assert [note.id for note in note_view.query_all()] == [2]
+    assert note_view.query_object(2).id == 2
+    with pytest.raises(NotFound):
+        note_view.query_object(1)
+
+
+def test_archive(app):
+    create_notes(5)
+    for note in Note.query.filter(Note.id != 3):
+        note.deleted_at = datetime.utcnow() - timedelta(days=note.id)
+    db.session.commit()
+
+    assert note_view.archive(datetime.utcnow() - timedelta(days=3)) == 2
+    assert [note.id for note in NoteArchive.query.order_by('id')] == [4, 5]
+
+    result = app.test_cli_runner().invoke(args=['archive-note'])
+    assert result.output == '2 note archived\n'
+    assert [note.id for note in Note.query] == [3]
+    assert [note.text for note in NoteArchive.query.order_by('id')] == [
+        'note0', 'note1', 'note3', 'note4']
+
+
+def test_archive_rolls_back_failed_batch(app):
+    create_notes(3)
+    for note in Note.query:
+        note.deleted_at = datetime.utcnow()
+    db.session.add(NoteArchive(id=3, text='conflict'))
+    db.session.commit()
+
+    with pytest.raises(IntegrityError):
+        note_view.archive()
+    assert [note.id for note in Note.query.order_by('id')] == [3]
+    assert NoteArchive.query.count() == 3